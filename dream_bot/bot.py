@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import asyncio
 import random
-from datetime import datetime, time, timedelta, timezone
-from typing import Any
+import time as _time
+from collections import OrderedDict
+from datetime import datetime, time, timedelta, timezone, tzinfo
+from functools import cached_property, lru_cache, wraps
+from typing import Any, Awaitable, Callable
 
 try:
     from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
@@ -10,12 +14,16 @@ except ImportError:  # Python < 3.9
     from backports.zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.error import Forbidden, RetryAfter, TimedOut
 from telegram.ext import (
+    AIORateLimiter,
     Application,
     CallbackQueryHandler,
     CommandHandler,
     ContextTypes,
     MessageHandler,
+    PersistenceInput,
+    PicklePersistence,
     filters,
 )
 
@@ -25,6 +33,7 @@ from .content import (
     DREAM_TYPES_GUIDE,
     ENTRY_QUESTIONS,
     NO_RECALL_ENTRY_QUESTIONS,
+    NUMERIC_ENTRY_KEYS,
     PROBING_QUESTIONS,
     RECALL_TIPS,
     SLEEP_QUALITY_OPTIONS,
@@ -34,20 +43,186 @@ from .db import Database
 from .exercises import LUCID_EXERCISES
 from .llm import DreamLLM
 
-NUMERIC_QUESTION_KEYS = {"lucidity_score", "reality_checks", "rem_minutes", "deep_sleep_minutes", "total_sleep_minutes"}
+# Max in-flight sends per broadcast; stays under Telegram's ~30 msg/s bot-wide limit.
+BROADCAST_CONCURRENCY = 25
+# Outbound Bot API requests per second allowed across all chats.
+OUTBOUND_MAX_RATE = 25
+# Seconds a reminder-target snapshot is reused across scheduled jobs.
+USERS_CACHE_TTL = 60
+# Updates processed in parallel so one slow OpenAI call doesn't stall other chats.
+CONCURRENT_UPDATES = 256
+# Upper bound on users whose last stored (username, chat) is remembered.
+ENSURED_USERS_MAX = 50_000
+# Never overlap runs of a broadcast job; a run delayed by a busy event loop still fires within the hour.
+# Jobs live in memory, so a run missed while the bot was down is not replayed after a restart.
+BROADCAST_JOB_KWARGS = {"max_instances": 1, "misfire_grace_time": 3600}
+# Seconds before an abandoned in-progress entry is discarded.
+ENTRY_TTL = 2 * 60 * 60
+# Distinct random exercises fetched per weekly broadcast and rotated across users.
+WEEKLY_EXERCISE_POOL = 16
+INDEX_PROJECTION = {
+    "entry_date": 1,
+    "created_at": 1,
+    "no_dream_recall": 1,
+    "title": 1,
+    "dream_types": 1,
+    "total_sleep_minutes": 1,
+    "_id": 0,
+}
+# Only the fields blockage_scan reads.
+BLOCKAGE_PROJECTION = {
+    "entry_date": 1,
+    "no_dream_recall": 1,
+    "title": 1,
+    "narrative": 1,
+    "mood": 1,
+    "symbols": 1,
+    "characters": 1,
+    "lucidity_score": 1,
+    "wake_feeling": 1,
+    "_id": 0,
+}
+TOGGLE_OPTIONS = {
+    "dream_types": DREAM_TYPE_OPTIONS,
+    "sleep_quality": SLEEP_QUALITY_OPTIONS,
+    "wake_feeling": WAKE_FEELING_OPTIONS,
+}
+
+_START_TEXT = (
+    "Dream Diary activated.\n\n"
+    "This bot is optimized for lucid dream training with progressive depth:\n"
+    "- Structured nightly journal\n"
+    "- Pattern detection and dream-sign tracking\n"
+    "- AI interpretation and 7-day lucid protocol\n"
+    "- Blockage finder (Depth, Cognitive, Threat frameworks)\n"
+    "- Streak system and anti-dropout variety\n\n"
+    "Weekly random exercise reminders are sent on Sunday at 09:00 UTC.\n\n"
+    "Daily reality checks are sent 3x/day at 07:00, 14:00, and 21:00 US Central.\n\n"
+    "Reality checks count only when you tap the reminder validation button.\n\n"
+    "Use the menu below."
+)
+
+_DAILY_REMINDER_TEXT = (
+    "Daily lucid protocol check:\n"
+    "1) Morning: log dreams immediately.\n"
+    "2) Daytime: 10 reality checks.\n"
+    "3) Night: intention phrase + visualize dream signs."
+)
+
+_REALITY_CHECK_REMINDER_TEXT = (
+    "Reality Check Reminder:\n"
+    "Pause for 20 seconds and ask: 'Am I dreaming or awake?'\n"
+    "Check for oddities, read text twice, and verify recent memory.\n"
+    "Tap 'Validate check' after you actually complete it.\n"
+    "Prompt: "
+)
+
+_BASELINE_PROTOCOL = (
+    "Lucid Dream Protocol (baseline):\n"
+    "- Morning: write within 3 minutes of waking.\n"
+    "- Daytime: 10 reality checks tied to cues (doorways, mirrors, phone).\n"
+    "- Evening: 10 minutes dream-sign review + intention script.\n"
+    "- Night: optional WBTB 1-2 times/week only if rested.\n"
+    "- Weekly: symbol review and trigger plan update."
+)
+
+
+@lru_cache(maxsize=1)
+def _central_tz() -> tzinfo:
+    try:
+        return ZoneInfo("America/Chicago")
+    except ZoneInfoNotFoundError:
+        return timezone.utc
+
+
+def _serial_per_chat(handler: Callable[..., Awaitable[None]]) -> Callable[..., Awaitable[None]]:
+    # Updates from one chat run in order; different chats still run concurrently.
+    @wraps(handler)
+    async def wrapper(self: DreamDiaryBot, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        chat_id = update.effective_chat.id if update.effective_chat else 0
+        slot = self._chat_locks.get(chat_id)
+        if slot is None:
+            slot = self._chat_locks[chat_id] = [asyncio.Lock(), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                await handler(self, update, context)
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                del self._chat_locks[chat_id]
+
+    return wrapper
 
 
 class DreamDiaryBot:
     def __init__(self) -> None:
         self.settings = load_settings()
-        self.db = Database(self.settings.mongodb_uri, self.settings.mongodb_db)
-        self.llm = DreamLLM(self.settings.openai_api_key, self.settings.openai_model)
-        self.sessions: dict[int, dict[str, Any]] = {}
-        self.central_tz = self._resolve_central_timezone()
-        self.db.seed_exercises(LUCID_EXERCISES)
+        self._users_cache: tuple[float, list[dict[str, Any]], frozenset[int]] | None = None
+        self._chat_locks: dict[int, list[Any]] = {}
+        self._ensured_users: OrderedDict[int, tuple[str | None, int | None]] = OrderedDict()
+        self.central_tz = _central_tz()
+        self._main_menu = self._build_main_menu_keyboard()
+        self._menu_dispatch = {
+            "index": self.show_index,
+            "exercise": self.show_random_exercise,
+            "interpret": self.interpret_last,
+            "protocol": self.show_protocol,
+            "blockages": self.show_blockages,
+            "stats": self.show_stats,
+            "drill": self.reality_drill,
+            "tips": self.show_tips,
+            "types": self.show_types,
+        }
+        self._drill_pool = list(PROBING_QUESTIONS)
+        random.shuffle(self._drill_pool)
+        self._drill_iter = iter(self._drill_pool)
+        self._toggle_cb = {
+            category: [(option, f"pick:{category}:toggle:{option}") for option in options]
+            for category, options in TOGGLE_OPTIONS.items()
+        }
+        self._toggle_done = {
+            category: [InlineKeyboardButton("Done", callback_data=f"pick:{category}:done")]
+            for category in TOGGLE_OPTIONS
+        }
+        self._toggle_markups: dict[tuple[str, frozenset[str], bool], InlineKeyboardMarkup] = {}
+        self._no_recall_row = [
+            InlineKeyboardButton("I don't remember any dreams", callback_data="pick:dream_types:no_recall")
+        ]
+
+    @cached_property
+    def db(self) -> Database:
+        return Database.get(self.settings.mongodb_uri, self.settings.mongodb_db)
+
+    @cached_property
+    def llm(self) -> DreamLLM:
+        return DreamLLM(self.settings.openai_api_key, self.settings.openai_model)
 
     def app(self) -> Application:
-        application = Application.builder().token(self.settings.telegram_bot_token).post_init(self.post_init).build()
+        application = (
+            Application.builder()
+            .token(self.settings.telegram_bot_token)
+            .concurrent_updates(CONCURRENT_UPDATES)
+            # One pooled connection per concurrent update so sends never wait on the pool.
+            .connection_pool_size(CONCURRENT_UPDATES)
+            .pool_timeout(30)
+            .connect_timeout(10)
+            .read_timeout(20)
+            .write_timeout(20)
+            .get_updates_connection_pool_size(8)
+            .get_updates_pool_timeout(30)
+            # Global token bucket over every Bot API call, under Telegram's ~30 msg/s bot-wide limit.
+            .rate_limiter(AIORateLimiter(overall_max_rate=OUTBOUND_MAX_RATE, overall_time_period=1))
+            # Keep in-progress entries (user_data) across restarts.
+            .persistence(
+                PicklePersistence(
+                    self.settings.state_file,
+                    store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+                )
+            )
+            .post_init(self.post_init)
+            .build()
+        )
 
         application.add_handler(CommandHandler("start", self.start))
         application.add_handler(CommandHandler("menu", self.menu))
@@ -61,13 +236,29 @@ class DreamDiaryBot:
         return application
 
     async def post_init(self, application: Application) -> None:
+        # First touch of self.db happens here, so the Mongo connection and index setup run off the loop.
+        await asyncio.to_thread(lambda: self.db.seed_exercises(LUCID_EXERCISES))
+
+        # JobQueue lives in memory; restore the per-user reminders saved with /set_reminder.
+        for row in await asyncio.to_thread(self.db.get_reminders):
+            # Access rules may have been tightened since the reminder was saved.
+            if not self.is_authorized(row["telegram_id"], row["chat_id"]):
+                continue
+            when = time(hour=row["hour"], minute=row["minute"], tzinfo=timezone.utc)
+            self.schedule_daily_reminder(application.job_queue, row["telegram_id"], row["chat_id"], when)
+
+        sweep_name = "sweep_stale_entries"
+        if not application.job_queue.get_jobs_by_name(sweep_name):
+            application.job_queue.run_repeating(self.sweep_stale_entries, interval=ENTRY_TTL / 2, name=sweep_name)
+
         weekly_name = "weekly_random_exercise_all_users"
         if not application.job_queue.get_jobs_by_name(weekly_name):
-            application.job_queue.run_repeating(
+            application.job_queue.run_daily(
                 self.weekly_exercise_reminder,
-                interval=7 * 24 * 60 * 60,
-                first=self._next_weekday_time(timezone.utc, weekday=6, at=time(hour=9, minute=0, tzinfo=timezone.utc)),
+                time=time(hour=9, minute=0, tzinfo=timezone.utc),
+                days=(0,),  # PTB counts days from Sunday = 0.
                 name=weekly_name,
+                job_kwargs=BROADCAST_JOB_KWARGS,
             )
 
         reality_check_times = [
@@ -83,22 +274,23 @@ class DreamDiaryBot:
                 self.daytime_reality_check_reminder,
                 time=scheduled_time,
                 name=job_name,
+                job_kwargs=BROADCAST_JOB_KWARGS,
             )
 
-    def _resolve_central_timezone(self):
-        try:
-            return ZoneInfo("America/Chicago")
-        except ZoneInfoNotFoundError:
-            return timezone.utc
-
-    def _next_weekday_time(self, tz, weekday: int, at: time) -> datetime:
-        now = datetime.now(tz)
-        candidate = now.replace(hour=at.hour, minute=at.minute, second=0, microsecond=0)
-        days_ahead = (weekday - candidate.weekday()) % 7
-        candidate = candidate + timedelta(days=days_ahead)
-        if candidate <= now:
-            candidate = candidate + timedelta(days=7)
-        return candidate
+    def next_probing_questions(self, k: int) -> list[str]:
+        # Walk a shuffled copy of the pool, reshuffling when exhausted; never repeat within one call.
+        k = min(k, len(self._drill_pool))
+        picked: list[str] = []
+        while len(picked) < k:
+            try:
+                question = next(self._drill_iter)
+            except StopIteration:
+                random.shuffle(self._drill_pool)
+                self._drill_iter = iter(self._drill_pool)
+                continue
+            if question not in picked:
+                picked.append(question)
+        return picked
 
     def central_today_iso(self) -> str:
         return datetime.now(self.central_tz).date().isoformat()
@@ -132,8 +324,31 @@ class DreamDiaryBot:
             await update.message.reply_text("Unauthorized chat/user for this bot.")
         return True
 
-    def reminder_targets(self) -> list[dict[str, Any]]:
-        users = self.db.get_users_with_chat_id()
+    async def ensure_user(self, user, chat_id: int | None) -> None:
+        # Skip the write only when it would store exactly what was stored last for this user.
+        stored = (user.username, chat_id)
+        if self._ensured_users.get(user.id) == stored:
+            self._ensured_users.move_to_end(user.id)
+            return
+        await asyncio.to_thread(self.db.ensure_user, user.id, user.username, chat_id=chat_id)
+        self._ensured_users[user.id] = stored
+        self._ensured_users.move_to_end(user.id)
+        if len(self._ensured_users) > ENSURED_USERS_MAX:
+            self._ensured_users.popitem(last=False)
+        # A chat the cached snapshot has never seen must show up in the next broadcast.
+        if chat_id is not None and self._users_cache is not None and chat_id not in self._users_cache[2]:
+            self._users_cache = None
+
+    async def cached_users(self) -> list[dict[str, Any]]:
+        now = _time.monotonic()
+        if self._users_cache is not None and now - self._users_cache[0] < USERS_CACHE_TTL:
+            return self._users_cache[1]
+        users = await asyncio.to_thread(self.db.get_users_with_chat_id)
+        self._users_cache = (now, users, frozenset(row["chat_id"] for row in users))
+        return users
+
+    async def reminder_targets(self) -> list[dict[str, Any]]:
+        users = await self.cached_users()
         return [
             row
             for row in users
@@ -148,22 +363,8 @@ class DreamDiaryBot:
             return
 
         chat_id = update.effective_chat.id if update.effective_chat else None
-        self.db.ensure_user(user.id, user.username, chat_id=chat_id)
-
-        text = (
-            "Dream Diary activated.\n\n"
-            "This bot is optimized for lucid dream training with progressive depth:\n"
-            "- Structured nightly journal\n"
-            "- Pattern detection and dream-sign tracking\n"
-            "- AI interpretation and 7-day lucid protocol\n"
-            "- Blockage finder (Depth, Cognitive, Threat frameworks)\n"
-            "- Streak system and anti-dropout variety\n\n"
-            "Weekly random exercise reminders are sent on Sunday at 09:00 UTC.\n\n"
-            "Daily reality checks are sent 3x/day at 07:00, 14:00, and 21:00 US Central.\n\n"
-            "Reality checks count only when you tap the reminder validation button.\n\n"
-            "Use the menu below."
-        )
-        await update.message.reply_text(text, reply_markup=self.main_menu_keyboard())
+        await self.ensure_user(user, chat_id)
+        await update.message.reply_text(_START_TEXT, reply_markup=self.main_menu_keyboard())
 
     async def menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         if await self.reject_if_unauthorized(update):
@@ -173,7 +374,7 @@ class DreamDiaryBot:
         user = update.effective_user
         if user is not None:
             chat_id = update.effective_chat.id if update.effective_chat else None
-            self.db.ensure_user(user.id, user.username, chat_id=chat_id)
+            await self.ensure_user(user, chat_id)
         await update.message.reply_text("Main menu", reply_markup=self.main_menu_keyboard())
 
     async def cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -182,7 +383,7 @@ class DreamDiaryBot:
         user = update.effective_user
         if user is None or update.message is None:
             return
-        self.sessions.pop(user.id, None)
+        context.user_data.pop("entry", None)
         await update.message.reply_text("Current flow canceled.", reply_markup=self.main_menu_keyboard())
 
     async def set_reminder(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -197,8 +398,7 @@ class DreamDiaryBot:
 
         raw = context.args[0]
         try:
-            hh, mm = raw.split(":")
-            when = time(hour=int(hh), minute=int(mm), tzinfo=timezone.utc)
+            when = datetime.strptime(raw, "%H:%M").time().replace(tzinfo=timezone.utc)
         except ValueError:
             await update.message.reply_text("Invalid time format. Use HH:MM in 24h format.")
             return
@@ -207,19 +407,11 @@ class DreamDiaryBot:
         if chat_id is None:
             return
 
-        job_name = f"daily_reminder_{update.effective_user.id}"
-        for job in context.job_queue.get_jobs_by_name(job_name):
-            job.schedule_removal()
-
-        context.job_queue.run_daily(
-            self.daily_reminder,
-            time=when,
-            chat_id=chat_id,
-            user_id=update.effective_user.id,
-            name=job_name,
-        )
+        user_id = update.effective_user.id
+        await asyncio.to_thread(self.db.set_reminder, user_id, chat_id, when.hour, when.minute)
+        self.schedule_daily_reminder(context.job_queue, user_id, chat_id, when)
         await update.message.reply_text(
-            f"Daily reminder set at {raw} UTC. I will prompt morning recall and evening intention every day."
+            f"Daily reminder set at {when:%H:%M} UTC. I will prompt morning recall and evening intention every day."
         )
 
     async def clear_reminder(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -228,46 +420,92 @@ class DreamDiaryBot:
         if update.message is None or update.effective_user is None:
             return
         job_name = f"daily_reminder_{update.effective_user.id}"
-        removed = 0
+        removed = await asyncio.to_thread(self.db.clear_reminder, update.effective_user.id)
         for job in context.job_queue.get_jobs_by_name(job_name):
             job.schedule_removal()
-            removed += 1
+            removed = True
         await update.message.reply_text("Reminder removed." if removed else "No reminder found.")
 
+    def schedule_daily_reminder(self, job_queue, user_id: int, chat_id: int, when: time) -> None:
+        job_name = f"daily_reminder_{user_id}"
+        for job in job_queue.get_jobs_by_name(job_name):
+            job.schedule_removal()
+
+        job_queue.run_daily(
+            self.daily_reminder,
+            time=when,
+            chat_id=chat_id,
+            user_id=user_id,
+            name=job_name,
+        )
+
     async def daily_reminder(self, context: ContextTypes.DEFAULT_TYPE) -> None:
         user_id = context.job.user_id
         if user_id is None:
             return
-        message = (
-            "Daily lucid protocol check:\n"
-            "1) Morning: log dreams immediately.\n"
-            "2) Daytime: 10 reality checks.\n"
-            "3) Night: intention phrase + visualize dream signs."
-        )
-        if context.job.chat_id is not None:
-            await context.bot.send_message(chat_id=context.job.chat_id, text=message)
+        if context.job.chat_id is None:
+            return
+        try:
+            await context.bot.send_message(chat_id=context.job.chat_id, text=_DAILY_REMINDER_TEXT)
+        except Forbidden:
+            # User blocked the bot; drop the reminder so it is neither retried nor restored on restart.
+            await asyncio.to_thread(self.db.clear_reminder, user_id)
+            context.job.schedule_removal()
+
+    async def broadcast(
+        self, context: ContextTypes.DEFAULT_TYPE, messages: list[tuple[int, str]], **kwargs: Any
+    ) -> None:
+        semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+        blocked: set[int] = set()
+
+        async def send(chat_id: int, text: str) -> None:
+            async with semaphore:
+                for _ in range(2):
+                    try:
+                        await context.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                        return
+                    except RetryAfter as exc:
+                        await asyncio.sleep(exc.retry_after)
+                    except TimedOut:
+                        await asyncio.sleep(1)
+                    except Forbidden:
+                        # User blocked the bot; stop targeting this chat.
+                        blocked.add(chat_id)
+                        return
+                    except Exception:
+                        # Chat is unavailable for some other reason.
+                        return
+
+        await asyncio.gather(*(send(chat_id, text) for chat_id, text in messages))
+        if blocked:
+            await self.forget_chats(blocked)
+
+    async def forget_chats(self, chat_ids: set[int]) -> None:
+        await asyncio.to_thread(self.db.clear_chat_ids, list(chat_ids))
+        self._users_cache = None
+        # Let ensure_user store the chat again if the user comes back.
+        for user_id in [user_id for user_id, (_, chat_id) in self._ensured_users.items() if chat_id in chat_ids]:
+            del self._ensured_users[user_id]
 
     async def weekly_exercise_reminder(self, context: ContextTypes.DEFAULT_TYPE) -> None:
-        users = self.reminder_targets()
+        users = await self.reminder_targets()
         if not users:
             return
 
-        for user in users:
-            chat_id = user.get("chat_id")
-            if chat_id is None:
-                continue
-            exercise = self.db.get_random_exercise()
-            if not exercise:
-                return
-            text = "Weekly Lucid Exercise:\n\n" + self.format_exercise(exercise)
-            try:
-                await context.bot.send_message(chat_id=chat_id, text=text)
-            except Exception:
-                # User may have blocked the bot or chat is unavailable.
-                continue
+        pool = await asyncio.to_thread(self.db.get_random_exercises, WEEKLY_EXERCISE_POOL)
+        if not pool:
+            return
+        texts = ["Weekly Lucid Exercise:\n\n" + self.format_exercise(exercise) for exercise in pool]
+        # Rotate the pool across recipients and send everything in one fan-out.
+        messages = [
+            (user["chat_id"], texts[idx % len(texts)])
+            for idx, user in enumerate(users)
+            if user.get("chat_id") is not None
+        ]
+        await self.broadcast(context, messages, disable_notification=True)
 
     async def daytime_reality_check_reminder(self, context: ContextTypes.DEFAULT_TYPE) -> None:
-        users = self.reminder_targets()
+        users = await self.reminder_targets()
         if not users:
             return
 
@@ -278,23 +516,10 @@ class DreamDiaryBot:
         callback_data = f"check:v:{local_date}:{slot}"
         keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("Validate check ✅", callback_data=callback_data)]])
 
-        question = random.choice(PROBING_QUESTIONS)
-        message = (
-            "Reality Check Reminder:\n"
-            "Pause for 20 seconds and ask: 'Am I dreaming or awake?'\n"
-            "Check for oddities, read text twice, and verify recent memory.\n"
-            "Tap 'Validate check' after you actually complete it.\n"
-            f"Prompt: {question}"
-        )
+        message = _REALITY_CHECK_REMINDER_TEXT + self.next_probing_questions(1)[0]
 
-        for user in users:
-            chat_id = user.get("chat_id")
-            if chat_id is None:
-                continue
-            try:
-                await context.bot.send_message(chat_id=chat_id, text=message, reply_markup=keyboard)
-            except Exception:
-                continue
+        messages = [(user["chat_id"], message) for user in users if user.get("chat_id") is not None]
+        await self.broadcast(context, messages, reply_markup=keyboard)
 
     async def handle_reality_check_callback(self, query, user_id: int, data: str) -> None:
         parts = data.split(":")
@@ -305,13 +530,13 @@ class DreamDiaryBot:
 
         _, _, local_date, slot = parts
         reminder_key = f"{local_date}:{slot}"
-        recorded = self.db.record_reality_check(user_id, reminder_key, local_date)
+        recorded = await asyncio.to_thread(self.db.record_reality_check, user_id, reminder_key, local_date)
         if not recorded:
             if query.message is not None:
                 await query.message.reply_text("Already validated for this reminder.")
             return
 
-        today_count = self.db.get_reality_check_count(user_id, local_date)
+        today_count = await asyncio.to_thread(self.db.get_reality_check_count, user_id, local_date)
         if query.message is not None:
             try:
                 await query.edit_message_reply_markup(reply_markup=None)
@@ -322,6 +547,9 @@ class DreamDiaryBot:
             )
 
     def main_menu_keyboard(self) -> InlineKeyboardMarkup:
+        return self._main_menu
+
+    def _build_main_menu_keyboard(self) -> InlineKeyboardMarkup:
         keys = [
             [InlineKeyboardButton("📝 New Dream Entry", callback_data="menu:new_entry")],
             [InlineKeyboardButton("📚 Dream Index", callback_data="menu:index")],
@@ -336,6 +564,7 @@ class DreamDiaryBot:
         ]
         return InlineKeyboardMarkup(keys)
 
+    @_serial_per_chat
     async def on_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         if await self.reject_if_unauthorized(update):
             return
@@ -344,103 +573,98 @@ class DreamDiaryBot:
         if query is None or user is None:
             return
         chat_id = update.effective_chat.id if update.effective_chat else None
-        self.db.ensure_user(user.id, user.username, chat_id=chat_id)
+        await self.ensure_user(user, chat_id)
         await query.answer()
 
         data = query.data or ""
-        if data.startswith("check:"):
+        prefix, _, rest = data.partition(":")
+        if prefix == "check":
             await self.handle_reality_check_callback(query, user.id, data)
             return
 
-        if data.startswith("menu:"):
-            action = data.split(":", 1)[1]
-            if action == "new_entry":
-                await self.begin_entry(query, user.id)
-            elif action == "index":
-                await self.show_index(query, user.id)
-            elif action == "exercise":
-                await self.show_random_exercise(query, user.id)
-            elif action == "interpret":
-                await self.interpret_last(query, user.id)
-            elif action == "protocol":
-                await self.show_protocol(query, user.id)
-            elif action == "blockages":
-                await self.show_blockages(query, user.id)
-            elif action == "stats":
-                await self.show_stats(query, user.id)
-            elif action == "drill":
-                await self.reality_drill(query)
-            elif action == "tips":
-                await query.message.reply_text(RECALL_TIPS)
-            elif action == "types":
-                await query.message.reply_text(DREAM_TYPES_GUIDE)
-            return
-
-        if data.startswith("pick:"):
-            await self.handle_picker_callback(query, user.id, data)
-
-    async def begin_entry(self, query, user_id: int) -> None:
+        if prefix == "menu":
+            if rest == "new_entry":
+                await self.begin_entry(query, user.id, context)
+                return
+            handler = self._menu_dispatch.get(rest)
+            if handler is not None:
+                await handler(query, user.id)
+            return
+
+        if prefix == "pick":
+            await self.handle_picker_callback(query, user.id, data, context)
+
+    async def begin_entry(self, query, user_id: int, context: ContextTypes.DEFAULT_TYPE) -> None:
         reality_checks_date = self.central_yesterday_iso()
-        validated_checks = self.db.get_reality_check_count(user_id, reality_checks_date)
-        self.sessions[user_id] = {
+        validated_checks = await asyncio.to_thread(self.db.get_reality_check_count, user_id, reality_checks_date)
+        context.user_data["entry"] = {
             "mode": "entry",
             "phase": "dream_types",
             "data": {
-                "dream_types": [],
-                "sleep_quality": [],
-                "wake_feeling": [],
+                "dream_types": set(),
+                "sleep_quality": set(),
+                "wake_feeling": set(),
                 "reality_checks": validated_checks,
                 "no_dream_recall": False,
             },
             "q_index": 0,
             "questions": ENTRY_QUESTIONS,
             "reality_checks_date": reality_checks_date,
+            "started_at": _time.time(),
         }
         await query.message.reply_text(
             "Step 1/4: Select dream types, then press Done.\n"
             "If you do not remember any dream, tap 'I don't remember any dreams'.",
-            reply_markup=self.build_toggle_keyboard("dream_types", DREAM_TYPE_OPTIONS, [], allow_no_recall=True),
+            reply_markup=self.build_toggle_keyboard("dream_types", set(), allow_no_recall=True),
         )
 
     def build_toggle_keyboard(
-        self, category: str, options: list[str], selected: list[str], allow_no_recall: bool = False
+        self, category: str, selected: set[str], allow_no_recall: bool = False
+    ) -> InlineKeyboardMarkup:
+        # At most 2^len(options) selections per category, so the memo stays small without eviction.
+        key = (category, frozenset(selected), allow_no_recall)
+        markup = self._toggle_markups.get(key)
+        if markup is None:
+            markup = self._toggle_markups[key] = self._build_toggle_keyboard(*key)
+        return markup
+
+    def _build_toggle_keyboard(
+        self, category: str, selected: frozenset[str], allow_no_recall: bool
     ) -> InlineKeyboardMarkup:
-        rows = []
-        for option in options:
-            mark = "✅ " if option in selected else "⬜ "
-            rows.append([InlineKeyboardButton(mark + option, callback_data=f"pick:{category}:toggle:{option}")])
+        rows = [
+            [InlineKeyboardButton(("✅ " if option in selected else "⬜ ") + option, callback_data=callback_data)]
+            for option, callback_data in self._toggle_cb[category]
+        ]
         if category == "dream_types" and allow_no_recall:
-            rows.append([InlineKeyboardButton("I don't remember any dreams", callback_data="pick:dream_types:no_recall")])
-        rows.append([InlineKeyboardButton("Done", callback_data=f"pick:{category}:done")])
+            rows.append(self._no_recall_row)
+        rows.append(self._toggle_done[category])
         return InlineKeyboardMarkup(rows)
 
-    async def handle_picker_callback(self, query, user_id: int, data: str) -> None:
-        session = self.sessions.get(user_id)
+    async def handle_picker_callback(
+        self, query, user_id: int, data: str, context: ContextTypes.DEFAULT_TYPE
+    ) -> None:
+        session = self.active_entry(context)
         if not session or session.get("mode") != "entry":
             await query.message.reply_text("No active entry. Tap 'New Dream Entry' first.")
             return
 
-        _, category, action, *rest = data.split(":")
+        _, _, tail = data.partition(":")
+        category, _, tail = tail.partition(":")
+        action, _, option = tail.partition(":")
         payload = session["data"]
+        # Callback data comes from the client; only known categories and options may reach the session.
+        if category not in TOGGLE_OPTIONS:
+            return
 
         if action == "toggle":
-            option = rest[0]
-            current = payload.get(category, [])
-            if option in current:
-                current.remove(option)
-            else:
-                current.append(option)
-            payload[category] = current
-
-            options_map = {
-                "dream_types": DREAM_TYPE_OPTIONS,
-                "sleep_quality": SLEEP_QUALITY_OPTIONS,
-                "wake_feeling": WAKE_FEELING_OPTIONS,
-            }
+            if option not in TOGGLE_OPTIONS[category]:
+                return
+            current = payload.setdefault(category, set())
+            current ^= {option}
+
             await query.edit_message_reply_markup(
                 reply_markup=self.build_toggle_keyboard(
                     category,
-                    options_map[category],
                     current,
                     allow_no_recall=category == "dream_types",
                 )
@@ -449,14 +673,14 @@ class DreamDiaryBot:
 
         if action == "no_recall" and category == "dream_types":
             payload["no_dream_recall"] = True
-            payload["dream_types"] = []
+            payload["dream_types"] = set()
             session["questions"] = NO_RECALL_ENTRY_QUESTIONS
             session["phase"] = "sleep_quality"
             await query.edit_message_reply_markup(reply_markup=None)
             await query.message.reply_text(
                 "No problem. We'll log sleep details for correlation.\n"
                 "Step 2/4: Select sleep quality.",
-                reply_markup=self.build_toggle_keyboard("sleep_quality", SLEEP_QUALITY_OPTIONS, payload["sleep_quality"]),
+                reply_markup=self.build_toggle_keyboard("sleep_quality", payload["sleep_quality"]),
             )
             return
 
@@ -468,14 +692,14 @@ class DreamDiaryBot:
                 session["phase"] = "sleep_quality"
                 await query.message.reply_text(
                     "Step 2/4: Select sleep quality.",
-                    reply_markup=self.build_toggle_keyboard("sleep_quality", SLEEP_QUALITY_OPTIONS, payload["sleep_quality"]),
+                    reply_markup=self.build_toggle_keyboard("sleep_quality", payload["sleep_quality"]),
                 )
                 return
             if category == "sleep_quality":
                 session["phase"] = "wake_feeling"
                 await query.message.reply_text(
                     "Step 3/4: Select waking feelings.",
-                    reply_markup=self.build_toggle_keyboard("wake_feeling", WAKE_FEELING_OPTIONS, payload["wake_feeling"]),
+                    reply_markup=self.build_toggle_keyboard("wake_feeling", payload["wake_feeling"]),
                 )
                 return
             if category == "wake_feeling":
@@ -484,13 +708,33 @@ class DreamDiaryBot:
                 if payload.get("no_dream_recall"):
                     step_4 = "Step 4/4: sleep details for no-recall logging. Type /cancel anytime."
                 await query.message.reply_text(step_4)
-                await self.ask_next_question(query.message.chat_id, query.message.get_bot(), user_id)
+                await self.ask_next_question(query.message.chat_id, user_id, context)
+
+    def active_entry(self, context: ContextTypes.DEFAULT_TYPE) -> dict[str, Any] | None:
+        session = context.user_data.get("entry")
+        if session is not None and _time.time() - session.get("started_at", 0) > ENTRY_TTL:
+            context.user_data.pop("entry", None)
+            return None
+        return session
+
+    async def sweep_stale_entries(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        # Users who abandon a flow and never return would otherwise keep it in user_data forever.
+        cutoff = _time.time() - ENTRY_TTL
+        swept = []
+        for user_id, data in context.application.user_data.items():
+            session = data.get("entry")
+            if session is not None and session.get("started_at", 0) < cutoff:
+                data.pop("entry", None)
+                swept.append(user_id)
+        if swept:
+            # This job is not bound to a user, so persistence only writes back what is marked here.
+            context.application.mark_data_for_update_persistence(user_ids=swept)
 
     def active_questions(self, session: dict[str, Any]) -> list[tuple[str, str]]:
         return session.get("questions", ENTRY_QUESTIONS)
 
-    async def ask_next_question(self, chat_id: int, bot, user_id: int) -> None:
-        session = self.sessions.get(user_id)
+    async def ask_next_question(self, chat_id: int, user_id: int, context: ContextTypes.DEFAULT_TYPE) -> None:
+        session = self.active_entry(context)
         if not session:
             return
 
@@ -501,7 +745,7 @@ class DreamDiaryBot:
             if key == "reality_checks" and "reality_checks" in session["data"]:
                 count = session["data"]["reality_checks"]
                 counted_for = session.get("reality_checks_date", "yesterday")
-                await bot.send_message(
+                await context.bot.send_message(
                     chat_id=chat_id,
                     text=(
                         f"Q{idx + 1}/{len(questions)}: Validated reality checks for {counted_for}: {count}.\n"
@@ -512,11 +756,12 @@ class DreamDiaryBot:
                 idx = session["q_index"]
                 continue
 
-            await bot.send_message(chat_id=chat_id, text=f"Q{idx + 1}/{len(questions)}: {prompt}")
+            await context.bot.send_message(chat_id=chat_id, text=f"Q{idx + 1}/{len(questions)}: {prompt}")
             return
 
-        await self.finish_entry(chat_id, bot, user_id)
+        await self.finish_entry(chat_id, user_id, context)
 
+    @_serial_per_chat
     async def on_text(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         if await self.reject_if_unauthorized(update):
             return
@@ -525,9 +770,9 @@ class DreamDiaryBot:
         if user is None or message is None:
             return
         chat_id = update.effective_chat.id if update.effective_chat else None
-        self.db.ensure_user(user.id, user.username, chat_id=chat_id)
+        await self.ensure_user(user, chat_id)
 
-        session = self.sessions.get(user.id)
+        session = self.active_entry(context)
         if not session or session.get("mode") != "entry" or session.get("phase") != "questions":
             await message.reply_text(
                 "Use /menu to open options, or tap New Dream Entry.",
@@ -538,68 +783,83 @@ class DreamDiaryBot:
         questions = self.active_questions(session)
         idx = session.get("q_index", 0)
         if idx >= len(questions):
-            await self.finish_entry(message.chat_id, context.bot, user.id)
+            await self.finish_entry(message.chat_id, user.id, context)
             return
 
         key, _ = questions[idx]
 
         value = message.text.strip()
-        if key in NUMERIC_QUESTION_KEYS:
-            if not value.isdigit():
+        if key in NUMERIC_ENTRY_KEYS:
+            try:
+                value = int(value)
+            except ValueError:
+                value = -1
+            if value < 0:
                 await message.reply_text("Please enter a number.")
                 return
-            value = int(value)
 
         session["data"][key] = value
         session["q_index"] = idx + 1
-        await self.ask_next_question(message.chat_id, context.bot, user.id)
+        await self.ask_next_question(message.chat_id, user.id, context)
 
-    async def finish_entry(self, chat_id: int, bot, user_id: int) -> None:
-        session = self.sessions.get(user_id)
+    async def finish_entry(self, chat_id: int, user_id: int, context: ContextTypes.DEFAULT_TYPE) -> None:
+        session = self.active_entry(context)
         if not session:
             return
         payload = session["data"]
-        payload["entry_date"] = datetime.now(timezone.utc).date().isoformat()
-        entry_id = self.db.save_entry(user_id, payload)
-        self.sessions.pop(user_id, None)
+        for category, options in TOGGLE_OPTIONS.items():
+            # Store selections as lists in the options' display order.
+            selected = payload.get(category, set())
+            payload[category] = [option for option in options if option in selected]
+        payload["entry_date"] = _time.strftime("%Y-%m-%d", _time.gmtime())
+        entry_id = await asyncio.to_thread(self.db.save_entry, user_id, payload)
+        context.user_data.pop("entry", None)
 
         if payload.get("no_dream_recall"):
-            summary = (
-                f"No-recall night saved. ID: {entry_id}\n"
-                f"Sleep quality: {', '.join(payload.get('sleep_quality', [])) or 'N/A'}\n"
-                f"Wake feeling: {', '.join(payload.get('wake_feeling', [])) or 'N/A'}\n"
+            lines = [
+                f"No-recall night saved. ID: {entry_id}",
+                f"Sleep quality: {', '.join(payload.get('sleep_quality', [])) or 'N/A'}",
+                f"Wake feeling: {', '.join(payload.get('wake_feeling', [])) or 'N/A'}",
                 f"REM: {payload.get('rem_minutes', 'N/A')} min | "
                 f"Deep: {payload.get('deep_sleep_minutes', 'N/A')} min | "
-                f"Total sleep: {payload.get('total_sleep_minutes', 'N/A')} min"
-            )
+                f"Total sleep: {payload.get('total_sleep_minutes', 'N/A')} min",
+            ]
             if payload.get("sleep_notes"):
-                summary += f"\nComment: {payload['sleep_notes']}"
-            await bot.send_message(chat_id=chat_id, text=summary, reply_markup=self.main_menu_keyboard())
+                lines.append(f"Comment: {payload['sleep_notes']}")
+            await context.bot.send_message(chat_id=chat_id, text="\n".join(lines), reply_markup=self.main_menu_keyboard())
             return
 
-        summary = (
-            f"Dream saved. ID: {entry_id}\n"
-            f"Title: {payload.get('title', 'Untitled')}\n"
-            f"Types: {', '.join(payload.get('dream_types', [])) or 'N/A'}\n"
-            f"Lucidity score: {payload.get('lucidity_score', 'N/A')}\n"
-            f"Reality checks (yesterday): {payload.get('reality_checks', 'N/A')}\n"
+        lines = [
+            f"Dream saved. ID: {entry_id}",
+            f"Title: {payload.get('title', 'Untitled')}",
+            f"Types: {', '.join(payload.get('dream_types', [])) or 'N/A'}",
+            f"Lucidity score: {payload.get('lucidity_score', 'N/A')}",
+            f"Reality checks (yesterday): {payload.get('reality_checks', 'N/A')}",
             f"REM: {payload.get('rem_minutes', 'N/A')} min | "
             f"Deep: {payload.get('deep_sleep_minutes', 'N/A')} min | "
-            f"Total: {payload.get('total_sleep_minutes', 'N/A')} min"
-        )
+            f"Total: {payload.get('total_sleep_minutes', 'N/A')} min",
+        ]
+        # Start the full interpretation now so it runs alongside the blockage paragraph.
+        interpretation = context.application.create_task(self.llm.interpret_dream(payload))
         try:
-            blockage_paragraph = self.llm.potential_blockages_paragraph(payload)
+            blockage_paragraph = await self.llm.potential_blockages_paragraph(payload)
         except Exception:
             blockage_paragraph = ""
         if blockage_paragraph:
-            summary += f"\n\nPotential blockages:\n{blockage_paragraph}"
-        await bot.send_message(chat_id=chat_id, text=summary, reply_markup=self.main_menu_keyboard())
+            lines.append(f"\nPotential blockages:\n{blockage_paragraph}")
+        await context.bot.send_message(chat_id=chat_id, text="\n".join(lines), reply_markup=self.main_menu_keyboard())
+        # The full interpretation can take several seconds; deliver it without holding this update.
+        context.application.create_task(self.send_interpretation(chat_id, interpretation, context))
 
-        interpretation = self.llm.interpret_dream(payload)
-        await bot.send_message(chat_id=chat_id, text=interpretation)
+    async def send_interpretation(
+        self, chat_id: int, interpretation: Awaitable[str], context: ContextTypes.DEFAULT_TYPE
+    ) -> None:
+        await context.bot.send_message(chat_id=chat_id, text=await interpretation)
 
     async def show_index(self, query, user_id: int) -> None:
-        entries = self.db.get_recent_entries(user_id, limit=12)
+        entries = await asyncio.to_thread(
+            self.db.get_recent_entries, user_id, limit=12, projection=INDEX_PROJECTION
+        )
         if not entries:
             await query.message.reply_text("No entries yet. Start with New Dream Entry.")
             return
@@ -626,14 +886,14 @@ class DreamDiaryBot:
         return f"{title}\nSource pages: {page_label}\n\n{body}".strip()
 
     async def show_random_exercise(self, query, user_id: int) -> None:
-        exercise = self.db.get_random_exercise()
+        exercise = await asyncio.to_thread(self.db.get_random_exercise)
         if not exercise:
             await query.message.reply_text("No exercises are stored yet.")
             return
         await query.message.reply_text(self.format_exercise(exercise))
 
     async def interpret_last(self, query, user_id: int) -> None:
-        last = self.db.get_last_entry(user_id)
+        last = await asyncio.to_thread(self.db.get_last_entry, user_id)
         if not last:
             await query.message.reply_text("No dream found. Save one first.")
             return
@@ -643,61 +903,61 @@ class DreamDiaryBot:
             )
             return
         await query.message.reply_text("Generating interpretation...")
-        text = self.llm.interpret_dream(last)
+        text = await self.llm.interpret_dream(last)
         await query.message.reply_text(text)
 
     async def show_protocol(self, query, user_id: int) -> None:
-        stats = self.db.get_stats(user_id)
-        recent = self.db.get_recent_entries(user_id, limit=14)
-
-        baseline = (
-            "Lucid Dream Protocol (baseline):\n"
-            "- Morning: write within 3 minutes of waking.\n"
-            "- Daytime: 10 reality checks tied to cues (doorways, mirrors, phone).\n"
-            "- Evening: 10 minutes dream-sign review + intention script.\n"
-            "- Night: optional WBTB 1-2 times/week only if rested.\n"
-            "- Weekly: symbol review and trigger plan update."
+        stats, recent, _ = await asyncio.gather(
+            asyncio.to_thread(self.db.get_stats, user_id),
+            asyncio.to_thread(self.db.get_recent_entries, user_id, limit=14, projection={"title": 1, "_id": 0}),
+            query.message.reply_text(_BASELINE_PROTOCOL),
         )
-        await query.message.reply_text(baseline)
 
-        ai_plan = self.llm.protocol_plan(stats, recent)
+        ai_plan = await self.llm.protocol_plan(stats, recent)
         await query.message.reply_text(ai_plan)
 
     async def show_blockages(self, query, user_id: int) -> None:
-        recent = self.db.get_recent_entries(user_id, limit=20)
-        recalled = [r for r in recent if not r.get("no_dream_recall")]
+        recalled = await asyncio.to_thread(
+            self.db.get_recent_entries, user_id, limit=8, projection=BLOCKAGE_PROJECTION, recalled_only=True
+        )
         if not recalled:
             await query.message.reply_text("I need at least one recalled dream entry to map blockages.")
             return
 
-        await query.message.reply_text("Analyzing blockages with depth/cognitive/threat frameworks...")
-        stats = self.db.get_stats(user_id)
-        text = self.llm.blockage_scan(stats, recalled)
+        stats, _ = await asyncio.gather(
+            asyncio.to_thread(self.db.get_stats, user_id),
+            query.message.reply_text("Analyzing blockages with depth/cognitive/threat frameworks..."),
+        )
+        text = await self.llm.blockage_scan(stats, recalled)
         await query.message.reply_text(text)
 
     async def show_stats(self, query, user_id: int) -> None:
-        stats = self.db.get_stats(user_id)
-        symbols = ", ".join([f"{k}({v})" for k, v in stats["top_symbols"]]) or "No recurring symbols yet"
+        stats = await asyncio.to_thread(self.db.get_stats, user_id)
+        symbols = ", ".join(f"{k}({v})" for k, v in stats["top_symbols"]) or "No recurring symbols yet"
         avg_recalled = f"{stats['avg_sleep_recalled']} min" if stats["avg_sleep_recalled"] is not None else "N/A"
         avg_no_recall = f"{stats['avg_sleep_no_recall']} min" if stats["avg_sleep_no_recall"] is not None else "N/A"
-        text = (
-            "Progress Snapshot:\n"
-            f"- 30-day entries: {stats['entries_30']}\n"
-            f"- 30-day recalled dreams: {stats['recalled_30']}\n"
-            f"- 30-day no-recall logs: {stats['no_recall_30']}\n"
-            f"- 30-day lucid count: {stats['lucid_30']}\n"
-            f"- Lucid ratio: {stats['lucid_ratio']}%\n"
-            f"- Avg sleep when dreams recalled: {avg_recalled}\n"
-            f"- Avg sleep when not recalled: {avg_no_recall}\n"
-            f"- Current streak: {stats['streak']} days\n"
-            f"- Top recurring symbols: {symbols}"
-        )
-        await query.message.reply_text(text)
+        parts = [
+            "Progress Snapshot:",
+            f"- 30-day entries: {stats['entries_30']}",
+            f"- 30-day recalled dreams: {stats['recalled_30']}",
+            f"- 30-day no-recall logs: {stats['no_recall_30']}",
+            f"- 30-day lucid count: {stats['lucid_30']}",
+            f"- Lucid ratio: {stats['lucid_ratio']}%",
+            f"- Avg sleep when dreams recalled: {avg_recalled}",
+            f"- Avg sleep when not recalled: {avg_no_recall}",
+            f"- Current streak: {stats['streak']} days",
+            f"- Top recurring symbols: {symbols}",
+        ]
+        await query.message.reply_text("\n".join(parts))
 
-    async def reality_drill(self, query) -> None:
-        questions = random.sample(PROBING_QUESTIONS, k=min(3, len(PROBING_QUESTIONS)))
-        text = "Reality Check Drill:\n" + "\n".join([f"- {q}" for q in questions])
-        await query.message.reply_text(text)
+    async def show_tips(self, query, user_id: int) -> None:
+        await query.message.reply_text(RECALL_TIPS)
+
+    async def show_types(self, query, user_id: int) -> None:
+        await query.message.reply_text(DREAM_TYPES_GUIDE)
+
+    async def reality_drill(self, query, user_id: int) -> None:
+        await query.message.reply_text("Reality Check Drill:\n- " + "\n- ".join(self.next_probing_questions(3)))
 
 
 
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import os
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -34,6 +35,7 @@ class Settings:
     default_timezone: str
     allowed_telegram_user_id: int | None
     allowed_chat_id: int | None
+    state_file: str
 
 
 def _optional_int(name: str) -> int | None:
@@ -46,6 +48,7 @@ def _optional_int(name: str) -> int | None:
         raise ValueError(f"Invalid {name}: expected integer value.") from exc
 
 
+@lru_cache(maxsize=1)
 def load_settings() -> Settings:
     token = os.getenv("TELEGRAM_BOT_TOKEN", "").strip()
     if not token:
@@ -60,4 +63,5 @@ def load_settings() -> Settings:
         default_timezone=os.getenv("DEFAULT_TIMEZONE", "UTC").strip(),
         allowed_telegram_user_id=_optional_int("ALLOWED_TELEGRAM_USER_ID"),
         allowed_chat_id=_optional_int("ALLOWED_CHAT_ID"),
+        state_file=os.getenv("STATE_FILE", "dream_bot_state.pickle").strip(),
     )
@@ -21,14 +21,14 @@ RECALL_TIPS = (
     "7) Re-read old entries weekly to detect recurring dream signs."
 )
 
-PROBING_QUESTIONS = [
+PROBING_QUESTIONS = (
     "What element grabbed your attention most vividly, and why?",
     "Was the setting realistic or fantastic? What memory does it resemble?",
     "What emotion dominated the dream from start to finish?",
     "Did any symbol or person appear that has shown up before?",
     "Where did your control increase or collapse in the dream?",
     "How did the dream ending affect your waking mood?",
-]
+)
 
 ENTRY_QUESTIONS = [
     ("title", "Give this dream a short title (example: 'Mirror City Chase')."),
@@ -57,6 +57,10 @@ NO_RECALL_ENTRY_QUESTIONS = [
     ("sleep_notes", "Any comments you'd like to add? (optional)"),
 ]
 
+NUMERIC_ENTRY_KEYS = frozenset(
+    {"lucidity_score", "reality_checks", "rem_minutes", "deep_sleep_minutes", "total_sleep_minutes"}
+)
+
 DREAM_TYPE_OPTIONS = [
     "Mundane",
     "Lucid",
@@ -1,32 +1,141 @@
 from __future__ import annotations
 
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from typing import Any
+from typing import Any, Callable
 
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument, UpdateOne
 from pymongo.collection import Collection
 from pymongo.errors import DuplicateKeyError
+from pymongo.write_concern import WriteConcern
+
+# Seconds stats and recent-entry reads are served from memory before hitting Mongo again.
+READ_CACHE_TTL = 60
+# Users kept in each read cache; the least recently written are evicted first.
+READ_CACHE_MAX_USERS = 2048
+ENTRIES_BY_USER_INDEX = [("telegram_id", 1), ("created_at", -1)]
+RECALLED_BY_USER_INDEX = [("telegram_id", 1), ("no_dream_recall", 1), ("created_at", -1)]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _cache_put(cache: OrderedDict[int, Any], key: int, value: Any) -> None:
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > READ_CACHE_MAX_USERS:
+        cache.popitem(last=False)
+
+
+def _normalize_symbols(raw: Any) -> list[str]:
+    return [s for s in (part.strip().lower() for part in str(raw or "").split(",")) if s]
 
 
 class Database:
+    _instances: dict[tuple[str, str], Database] = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, uri: str, db_name: str) -> Database:
+        # One pooled client (and one index/backfill pass) per database for the whole process.
+        with cls._instances_lock:
+            instance = cls._instances.get((uri, db_name))
+            if instance is None:
+                instance = cls._instances[(uri, db_name)] = cls(uri, db_name)
+            return instance
+
     def __init__(self, uri: str, db_name: str) -> None:
-        self.client = MongoClient(uri)
+        self.client = MongoClient(
+            uri,
+            maxPoolSize=50,
+            minPoolSize=5,
+            maxIdleTimeMS=60000,
+            # zstd when the server supports it, zlib otherwise; narratives compress well.
+            compressors="zstd,zlib",
+            zlibCompressionLevel=6,
+            retryReads=True,
+            retryWrites=True,
+            serverSelectionTimeoutMS=3000,
+        )
         self.db = self.client[db_name]
         self.users: Collection = self.db["users"]
+        # Fire-and-forget handle for writes where a rare lost update is acceptable.
+        self._users_unacked: Collection = self.users.with_options(write_concern=WriteConcern(w=0))
         self.entries: Collection = self.db["dream_entries"]
         self.exercises: Collection = self.db["lucid_exercises"]
         self.reality_checks: Collection = self.db["reality_check_validations"]
+        self.reality_check_counters: Collection = self.db["reality_check_counters"]
+        self.reminders: Collection = self.db["daily_reminders"]
+        self.migrations: Collection = self.db["migrations"]
+        self._cache_lock = threading.Lock()
+        self._stats_cache: OrderedDict[int, tuple[float, dict[str, Any]]] = OrderedDict()
+        self._recent_cache: OrderedDict[
+            int, dict[tuple[int, tuple[str, ...] | None, bool], tuple[float, list[dict[str, Any]]]]
+        ] = OrderedDict()
         self._ensure_indexes()
+        self._run_once("normalized_symbols", self._backfill_normalized_symbols)
+        self._run_once("reality_check_counters", self._backfill_reality_check_counters)
 
     def _ensure_indexes(self) -> None:
         self.users.create_index("telegram_id", unique=True)
-        self.entries.create_index([("telegram_id", 1), ("created_at", -1)])
+        self.entries.create_index(ENTRIES_BY_USER_INDEX)
+        self.entries.create_index(RECALLED_BY_USER_INDEX)
+        # Nothing queries by entry_date since the streak recount moved to created_at.
+        if "telegram_id_1_entry_date_1" in self.entries.index_information():
+            self.entries.drop_index("telegram_id_1_entry_date_1")
         self.exercises.create_index("slug", unique=True)
         self.reality_checks.create_index([("telegram_id", 1), ("reminder_key", 1)], unique=True)
         self.reality_checks.create_index([("telegram_id", 1), ("local_date", 1)])
+        self.reality_check_counters.create_index([("telegram_id", 1), ("local_date", 1)], unique=True)
+        self.reminders.create_index("telegram_id", unique=True)
+
+    def _run_once(self, name: str, migrate: Callable[[], None]) -> None:
+        # Backfills scan whole collections; record completion so later boots skip them.
+        if self.migrations.find_one({"_id": name}, {"_id": 1}) is not None:
+            return
+        migrate()
+        self.migrations.update_one({"_id": name}, {"$setOnInsert": {"applied_at": _now()}}, upsert=True)
+
+    def _backfill_normalized_symbols(self) -> None:
+        # Entries saved before symbols_normalized existed get it computed server-side, once.
+        symbols = {"$cond": [{"$eq": [{"$type": "$symbols"}, "string"]}, "$symbols", ""]}
+        parts = {
+            "$map": {"input": {"$split": [symbols, ","]}, "as": "s", "in": {"$toLower": {"$trim": {"input": "$$s"}}}}
+        }
+        self.entries.update_many(
+            {"symbols_normalized": {"$exists": False}},
+            [{"$set": {"symbols_normalized": {"$filter": {"input": parts, "as": "s", "cond": {"$ne": ["$$s", ""]}}}}}],
+        )
+
+    def _backfill_reality_check_counters(self) -> None:
+        # Only today's and yesterday's counts are ever read; seed counters for days recorded before they existed.
+        since = (_now().date() - timedelta(days=3)).isoformat()
+        self.reality_checks.aggregate(
+            [
+                {"$match": {"local_date": {"$gte": since}}},
+                {
+                    "$group": {
+                        "_id": {"telegram_id": "$telegram_id", "local_date": "$local_date"},
+                        "count": {"$sum": 1},
+                    }
+                },
+                {"$replaceWith": {"telegram_id": "$_id.telegram_id", "local_date": "$_id.local_date", "count": "$count"}},
+                {
+                    "$merge": {
+                        "into": self.reality_check_counters.name,
+                        "on": ["telegram_id", "local_date"],
+                        "whenMatched": "keepExisting",
+                        "whenNotMatched": "insert",
+                    }
+                },
+            ]
+        )
 
     def ensure_user(self, telegram_id: int, username: str | None, chat_id: int | None = None) -> dict[str, Any]:
-        now = datetime.now(timezone.utc)
+        now = _now()
         updates = {
             "username": username,
             "updated_at": now,
@@ -34,69 +143,127 @@ class Database:
         if chat_id is not None:
             updates["chat_id"] = chat_id
 
-        self.users.update_one(
-            {"telegram_id": telegram_id},
-            {
-                "$setOnInsert": {
-                    "telegram_id": telegram_id,
-                    "created_at": now,
-                    "streak": 0,
+        return (
+            self.users.find_one_and_update(
+                {"telegram_id": telegram_id},
+                {
+                    "$setOnInsert": {
+                        "telegram_id": telegram_id,
+                        "created_at": now,
+                        "streak": 0,
+                    },
+                    "$set": updates,
                 },
-                "$set": updates,
-            },
-            upsert=True,
+                projection={"telegram_id": 1, "streak": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            or {}
         )
-        return self.users.find_one({"telegram_id": telegram_id}) or {}
 
     def save_entry(self, telegram_id: int, entry: dict[str, Any]) -> str:
-        now = datetime.now(timezone.utc)
+        now = _now()
         payload = {
             **entry,
+            "symbols_normalized": _normalize_symbols(entry.get("symbols")),
             "telegram_id": telegram_id,
             "created_at": now,
             "updated_at": now,
         }
         result = self.entries.insert_one(payload)
-        self._update_streak(telegram_id)
+        self._update_streak(telegram_id, now)
+        with self._cache_lock:
+            self._stats_cache.pop(telegram_id, None)
+            self._recent_cache.pop(telegram_id, None)
         return str(result.inserted_id)
 
     def get_last_entry(self, telegram_id: int) -> dict[str, Any] | None:
         return self.entries.find_one({"telegram_id": telegram_id}, sort=[("created_at", -1)])
 
-    def get_recent_entries(self, telegram_id: int, limit: int = 30) -> list[dict[str, Any]]:
-        return list(self.entries.find({"telegram_id": telegram_id}).sort("created_at", -1).limit(limit))
+    def get_recent_entries(
+        self,
+        telegram_id: int,
+        limit: int = 30,
+        projection: dict[str, Any] | None = None,
+        recalled_only: bool = False,
+    ) -> list[dict[str, Any]]:
+        now = time.monotonic()
+        key = (limit, tuple(projection) if projection else None, recalled_only)
+        cached = self._recent_cache.get(telegram_id, {}).get(key)
+        if cached is not None and now - cached[0] < READ_CACHE_TTL:
+            return cached[1]
+        query: dict[str, Any] = {"telegram_id": telegram_id}
+        if recalled_only:
+            # Point bounds (older entries may lack the field) keep index order, so limit stops the scan early.
+            query["no_dream_recall"] = {"$in": [False, None]}
+        rows = list(
+            self.entries.find(query, projection)
+            .sort("created_at", -1)
+            .limit(limit)
+            .hint(RECALLED_BY_USER_INDEX if recalled_only else ENTRIES_BY_USER_INDEX)
+        )
+        with self._cache_lock:
+            per_user = self._recent_cache.get(telegram_id, {})
+            per_user[key] = (now, rows)
+            _cache_put(self._recent_cache, telegram_id, per_user)
+        return rows
 
     def seed_exercises(self, exercises: list[dict[str, Any]]) -> int:
-        now = datetime.now(timezone.utc)
-        inserted = 0
+        now = _now()
+        ops = []
         for exercise in exercises:
             slug = str(exercise.get("slug", "")).strip()
             if not slug:
                 continue
-            result = self.exercises.update_one(
-                {"slug": slug},
-                {
-                    "$set": {
-                        **exercise,
-                        "updated_at": now,
+            ops.append(
+                UpdateOne(
+                    {"slug": slug},
+                    {
+                        "$set": {
+                            **exercise,
+                            "updated_at": now,
+                        },
+                        "$setOnInsert": {"created_at": now},
                     },
-                    "$setOnInsert": {"created_at": now},
-                },
-                upsert=True,
+                    upsert=True,
+                )
             )
-            if result.upserted_id is not None:
-                inserted += 1
-        return inserted
+        if not ops:
+            return 0
+        result = self.exercises.bulk_write(ops, ordered=False)
+        return result.upserted_count
 
     def get_random_exercise(self) -> dict[str, Any] | None:
-        rows = list(self.exercises.aggregate([{"$sample": {"size": 1}}]))
-        return rows[0] if rows else None
+        return next(self.exercises.aggregate([{"$sample": {"size": 1}}]), None)
+
+    def get_random_exercises(self, k: int) -> list[dict[str, Any]]:
+        return list(self.exercises.aggregate([{"$sample": {"size": k}}]))
 
     def get_users_with_chat_id(self) -> list[dict[str, Any]]:
         return list(self.users.find({"chat_id": {"$exists": True}}, {"telegram_id": 1, "chat_id": 1, "_id": 0}))
 
+    def clear_chat_ids(self, chat_ids: list[int]) -> None:
+        self.users.update_many({"chat_id": {"$in": chat_ids}}, {"$unset": {"chat_id": ""}})
+
+    def set_reminder(self, telegram_id: int, chat_id: int, hour: int, minute: int) -> None:
+        now = _now()
+        self.reminders.update_one(
+            {"telegram_id": telegram_id},
+            {
+                "$set": {"chat_id": chat_id, "hour": hour, "minute": minute, "updated_at": now},
+                "$setOnInsert": {"created_at": now},
+            },
+            upsert=True,
+        )
+
+    def clear_reminder(self, telegram_id: int) -> bool:
+        return self.reminders.delete_one({"telegram_id": telegram_id}).deleted_count > 0
+
+    def get_reminders(self) -> list[dict[str, Any]]:
+        return list(self.reminders.find({}, {"telegram_id": 1, "chat_id": 1, "hour": 1, "minute": 1, "_id": 0}))
+
     def record_reality_check(self, telegram_id: int, reminder_key: str, local_date: str) -> bool:
-        now = datetime.now(timezone.utc)
+        now = _now()
         payload = {
             "telegram_id": telegram_id,
             "reminder_key": reminder_key,
@@ -107,71 +274,158 @@ class Database:
             self.reality_checks.insert_one(payload)
         except DuplicateKeyError:
             return False
+        self.reality_check_counters.update_one(
+            {"telegram_id": telegram_id, "local_date": local_date},
+            {"$inc": {"count": 1}},
+            upsert=True,
+        )
         return True
 
     def get_reality_check_count(self, telegram_id: int, local_date: str) -> int:
-        return int(self.reality_checks.count_documents({"telegram_id": telegram_id, "local_date": local_date}))
+        doc = self.reality_check_counters.find_one(
+            {"telegram_id": telegram_id, "local_date": local_date}, {"count": 1, "_id": 0}
+        )
+        return int(doc.get("count", 0)) if doc else 0
 
     def get_stats(self, telegram_id: int) -> dict[str, Any]:
-        entries_30 = self.get_recent_entries(telegram_id, limit=30)
-        recalled_entries = [e for e in entries_30 if not e.get("no_dream_recall", False)]
-        no_recall_entries = [e for e in entries_30 if e.get("no_dream_recall", False)]
-        lucid_count = sum(1 for e in recalled_entries if "Lucid" in e.get("dream_types", []))
-        recurring = {}
-        for e in recalled_entries:
-            symbols = str(e.get("symbols", "")).split(",")
-            for raw in symbols:
-                s = raw.strip().lower()
-                if s:
-                    recurring[s] = recurring.get(s, 0) + 1
-        top_symbols = sorted(recurring.items(), key=lambda it: it[1], reverse=True)[:5]
-        user = self.users.find_one({"telegram_id": telegram_id}) or {}
-
-        def average_sleep_minutes(rows: list[dict[str, Any]]) -> float | None:
-            values = [v for v in (row.get("total_sleep_minutes") for row in rows) if isinstance(v, int)]
-            if not values:
-                return None
-            return round(sum(values) / len(values), 1)
+        now = time.monotonic()
+        cached = self._stats_cache.get(telegram_id)
+        if cached is not None and now - cached[0] < READ_CACHE_TTL:
+            return cached[1]
+        stats = self._compute_stats(telegram_id)
+        with self._cache_lock:
+            _cache_put(self._stats_cache, telegram_id, (now, stats))
+        return stats
+
+    def _compute_stats(self, telegram_id: int) -> dict[str, Any]:
+        recalled = {"$ne": ["$no_dream_recall", True]}
+        is_lucid = {"$in": ["Lucid", {"$ifNull": ["$dream_types", []]}]}
+        pipeline = [
+            {"$match": {"telegram_id": telegram_id}},
+            {"$sort": {"created_at": -1}},
+            {"$limit": 30},
+            {
+                "$facet": {
+                    "totals": [
+                        {
+                            "$group": {
+                                "_id": recalled,
+                                "count": {"$sum": 1},
+                                "lucid": {"$sum": {"$cond": [is_lucid, 1, 0]}},
+                                "avg_sleep": {"$avg": "$total_sleep_minutes"},
+                            }
+                        }
+                    ],
+                    "symbols": [
+                        {"$match": {"no_dream_recall": {"$ne": True}}},
+                        {"$unwind": "$symbols_normalized"},
+                        {"$group": {"_id": "$symbols_normalized", "count": {"$sum": 1}}},
+                        {"$sort": {"count": -1, "_id": 1}},
+                        {"$limit": 5},
+                    ],
+                    # Pull the stored streak through the same round trip; no entries means no streak.
+                    "user": [
+                        {"$limit": 1},
+                        {
+                            "$lookup": {
+                                "from": self.users.name,
+                                "localField": "telegram_id",
+                                "foreignField": "telegram_id",
+                                "pipeline": [{"$project": {"_id": 0, "streak": 1}}],
+                                "as": "user",
+                            }
+                        },
+                        {"$replaceWith": {"$ifNull": [{"$first": "$user"}, {}]}},
+                    ],
+                }
+            },
+        ]
+        result = next(self.entries.aggregate(pipeline, hint=ENTRIES_BY_USER_INDEX), {})
+        totals = {row["_id"]: row for row in result.get("totals", [])}
+        recalled_row = totals.get(True, {})
+        no_recall_row = totals.get(False, {})
+        recalled_count = recalled_row.get("count", 0)
+        lucid_count = recalled_row.get("lucid", 0)
+        user = next(iter(result.get("user", [])), {})
+
+        def average_sleep_minutes(row: dict[str, Any]) -> float | None:
+            value = row.get("avg_sleep")
+            return round(value, 1) if value is not None else None
 
         return {
-            "entries_30": len(entries_30),
-            "recalled_30": len(recalled_entries),
-            "no_recall_30": len(no_recall_entries),
+            "entries_30": recalled_count + no_recall_row.get("count", 0),
+            "recalled_30": recalled_count,
+            "no_recall_30": no_recall_row.get("count", 0),
             "lucid_30": lucid_count,
-            "lucid_ratio": round((lucid_count / len(recalled_entries)) * 100, 1) if recalled_entries else 0,
-            "avg_sleep_recalled": average_sleep_minutes(recalled_entries),
-            "avg_sleep_no_recall": average_sleep_minutes(no_recall_entries),
+            "lucid_ratio": round((lucid_count / recalled_count) * 100, 1) if recalled_count else 0,
+            "avg_sleep_recalled": average_sleep_minutes(recalled_row),
+            "avg_sleep_no_recall": average_sleep_minutes(no_recall_row),
             "streak": int(user.get("streak", 0)),
-            "top_symbols": top_symbols,
+            "top_symbols": [(row["_id"], row["count"]) for row in result.get("symbols", [])],
         }
 
-    def _update_streak(self, telegram_id: int) -> None:
-        today = datetime.now(timezone.utc).date()
-        start = datetime.combine(today - timedelta(days=60), datetime.min.time(), tzinfo=timezone.utc)
-        recent = list(
-            self.entries.find(
-                {"telegram_id": telegram_id, "created_at": {"$gte": start}},
-                {"created_at": 1, "_id": 0},
-            ).sort("created_at", -1)
+    def _update_streak(self, telegram_id: int, now: datetime) -> None:
+        today = now.date()
+        day = today.isoformat()
+        yesterday = (today - timedelta(days=1)).isoformat()
+        # Extend, keep or reset the streak server-side from the user's last entry day in one round trip.
+        previous = self.users.find_one_and_update(
+            {"telegram_id": telegram_id},
+            [
+                {
+                    "$set": {
+                        "streak": {
+                            "$switch": {
+                                "branches": [
+                                    {
+                                        "case": {"$eq": ["$last_entry_date", day]},
+                                        "then": {"$max": [{"$ifNull": ["$streak", 0]}, 1]},
+                                    },
+                                    {
+                                        "case": {"$eq": ["$last_entry_date", yesterday]},
+                                        "then": {"$add": [{"$ifNull": ["$streak", 0]}, 1]},
+                                    },
+                                ],
+                                "default": 1,
+                            }
+                        },
+                        "last_entry_date": day,
+                        "updated_at": now,
+                    }
+                }
+            ],
+            projection={"last_entry_date": 1, "_id": 0},
+            upsert=True,
         )
+        if previous is None or "last_entry_date" not in previous:
+            # Users from before last_entry_date was tracked need one full recount.
+            self._recompute_streak(telegram_id, now)
 
-        unique_days = []
-        seen = set()
-        for row in recent:
-            day = row["created_at"].date()
-            if day not in seen:
-                seen.add(day)
-                unique_days.append(day)
+    def _recompute_streak(self, telegram_id: int, now: datetime) -> None:
+        today = now.date()
+        start = datetime.combine(today - timedelta(days=60), datetime.min.time(), tzinfo=timezone.utc)
+        # Group on the UTC day of created_at so entries without entry_date still count.
+        days = self.entries.aggregate(
+            [
+                {"$match": {"telegram_id": telegram_id, "created_at": {"$gte": start}}},
+                {
+                    "$group": {
+                        "_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at", "timezone": "UTC"}}
+                    }
+                },
+            ],
+            hint=ENTRIES_BY_USER_INDEX,
+        )
+        day_set = {row["_id"] for row in days}
 
         streak = 0
         cursor = today
-        day_set = set(unique_days)
-        while cursor in day_set:
+        while cursor.isoformat() in day_set:
             streak += 1
             cursor = cursor - timedelta(days=1)
 
-        self.users.update_one(
+        self._users_unacked.update_one(
             {"telegram_id": telegram_id},
-            {"$set": {"streak": streak, "updated_at": datetime.now(timezone.utc)}},
+            {"$set": {"streak": streak, "updated_at": now}},
             upsert=True,
         )
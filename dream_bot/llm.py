@@ -1,21 +1,106 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import time
+from collections import OrderedDict
 from typing import Any
 
-from openai import OpenAI
+from openai import AsyncOpenAI
+
+# Identical prompts within this window reuse the earlier completion.
+RESPONSE_CACHE_TTL = 600
+RESPONSE_CACHE_MAX = 256
+
+_SYS_INTERPRET = (
+    "You are a lucid dreaming coach inspired by evidence-based practices "
+    "(dream recall training, MILD, reality testing, sleep hygiene, WBTB). "
+    "You never claim medical certainty. Keep output practical and safe. "
+    "Respond in plain text (no markdown symbols) with sections:\n"
+    "Core Themes:\nDream Signs:\nTonight Action Plan:\nOne Reflection Question:\n"
+    "Use short bullets and keep total response compact."
+)
+
+_SYS_PROTOCOL = (
+    "You are a world-class lucid dreaming protocol designer. "
+    "Make a 7-day progressive protocol for a Telegram user. "
+    "Blend consistency and variety to reduce dropout. "
+    "Use sections: Day Routine, Pre-Sleep, Night Interrupt, Morning Capture, Weekly Review. "
+    "Add a difficulty score 1-10 and one anti-burnout adaptation."
+)
+
+_SYS_BLOCKAGE = (
+    "You are a lucid dreaming coach focused on finding and fixing personal blockages. "
+    "Use three lenses and label each as a hypothesis, not certainty:\n"
+    "1) Psychoanalytic/depth (Freud/Jung-style conflict, shadow, compensatory themes).\n"
+    "2) Cognitive/neurocognitive (Domhoff-style continuity of waking concerns and emotion).\n"
+    "3) Threat simulation (Revonsuo-style fear/threat rehearsal patterns).\n"
+    "Never diagnose disorders or claim medical truth. Keep practical and safe.\n"
+    "Respond in plain text with sections:\n"
+    "Likely Blockages:\n"
+    "Evidence From Recent Dreams:\n"
+    "Framework Synthesis (Depth / Cognitive / Threat):\n"
+    "Lucid Repair Plan (Day / Pre-Sleep / In-Dream / Morning):\n"
+    "7-Day Exposure Ladder:\n"
+    "Tonight's One-Sentence Intention:\n"
+    "Use concise bullets."
+)
+
+_SYS_BLOCKAGE_PARA = (
+    "You are a lucid dream coach. "
+    "Write exactly one short paragraph (2-3 sentences, max 70 words). "
+    "Infer potential emotional/behavioral blockages as hypotheses only, not facts. "
+    "Blend depth (Freud/Jung), cognitive continuity (Domhoff), and threat simulation (Revonsuo) briefly. "
+    "End with one practical next step for tonight."
+)
+
+# (label, entry key) pairs rendered one per line into the user prompt.
+_INTERPRET_FIELDS = (
+    ("Dream title", "title"),
+    ("Types", "dream_types"),
+    ("Narrative", "narrative"),
+    ("Mood", "mood"),
+    ("Symbols", "symbols"),
+    ("Self interpretation", "self_interpretation"),
+    ("Lucidity score", "lucidity_score"),
+    ("REM minutes", "rem_minutes"),
+    ("Deep sleep minutes", "deep_sleep_minutes"),
+    ("Total sleep minutes", "total_sleep_minutes"),
+)
+_BLOCKAGE_PARA_FIELDS = (
+    ("Title", "title"),
+    ("Narrative", "narrative"),
+    ("Mood", "mood"),
+    ("Symbols", "symbols"),
+    ("Self interpretation", "self_interpretation"),
+)
+
+# Entry fields passed through to blockage_scan; the narrative is added separately, truncated.
+_BLOCKAGE_SCAN_KEYS = ("entry_date", "title", "mood", "symbols", "characters", "lucidity_score", "wake_feeling")
+
+
+def _render_fields(entry: dict[str, Any], fields: tuple[tuple[str, str], ...]) -> str:
+    return "\n".join(f"{label}: {entry.get(key, '')}" for label, key in fields)
 
 
 class DreamLLM:
     def __init__(self, api_key: str, model: str) -> None:
         self.enabled = bool(api_key)
         self.model = model
-        self.client = OpenAI(api_key=api_key) if self.enabled else None
+        self.client = AsyncOpenAI(api_key=api_key) if self.enabled else None
+        self._cache: OrderedDict[str, tuple[float, str]] = OrderedDict()
 
-    def _chat(self, system: str, user: str) -> str:
+    async def _chat(self, system: str, user: str) -> str:
         if not self.enabled or self.client is None:
             return "LLM disabled. Add OPENAI_API_KEY in .env to enable AI interpretation and protocol coaching."
+        key = hashlib.blake2b(f"{system}\x00{user}".encode(), digest_size=16).hexdigest()
+        now = time.monotonic()
+        cached = self._cache.get(key)
+        if cached and now - cached[0] < RESPONSE_CACHE_TTL:
+            self._cache.move_to_end(key)
+            return cached[1]
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 temperature=0.7,
                 messages=[
@@ -23,9 +108,16 @@ class DreamLLM:
                     {"role": "user", "content": user},
                 ],
             )
-            return response.choices[0].message.content or "No response generated."
+            text = response.choices[0].message.content
         except Exception:
             return "AI analysis unavailable right now. Try again in a moment."
+        if not text:
+            return "No response generated."
+        self._cache[key] = (now, text)
+        self._cache.move_to_end(key)
+        while len(self._cache) > RESPONSE_CACHE_MAX:
+            self._cache.popitem(last=False)
+        return text
 
     def _fallback_blockage_paragraph(self, entry: dict[str, Any]) -> str:
         mood = str(entry.get("mood", "")).strip()
@@ -41,105 +133,42 @@ class DreamLLM:
             f"{core}. Use one reality check on that theme tomorrow and set a calm in-dream intention to face it."
         )
 
-    def interpret_dream(self, entry: dict[str, Any]) -> str:
-        system = (
-            "You are a lucid dreaming coach inspired by evidence-based practices "
-            "(dream recall training, MILD, reality testing, sleep hygiene, WBTB). "
-            "You never claim medical certainty. Keep output practical and safe. "
-            "Respond in plain text (no markdown symbols) with sections:\n"
-            "Core Themes:\nDream Signs:\nTonight Action Plan:\nOne Reflection Question:\n"
-            "Use short bullets and keep total response compact."
-        )
-        user = (
-            f"Dream title: {entry.get('title', '')}\n"
-            f"Types: {entry.get('dream_types', [])}\n"
-            f"Narrative: {entry.get('narrative', '')}\n"
-            f"Mood: {entry.get('mood', '')}\n"
-            f"Symbols: {entry.get('symbols', '')}\n"
-            f"Self interpretation: {entry.get('self_interpretation', '')}\n"
-            f"Lucidity score: {entry.get('lucidity_score', '')}\n"
-            f"REM minutes: {entry.get('rem_minutes', '')}\n"
-            f"Deep sleep minutes: {entry.get('deep_sleep_minutes', '')}\n"
-            f"Total sleep minutes: {entry.get('total_sleep_minutes', '')}"
-        )
-        return self._chat(system, user)
+    async def interpret_dream(self, entry: dict[str, Any]) -> str:
+        return await self._chat(_SYS_INTERPRET, _render_fields(entry, _INTERPRET_FIELDS))
 
-    def protocol_plan(self, stats: dict[str, Any], recent: list[dict[str, Any]]) -> str:
+    async def protocol_plan(self, stats: dict[str, Any], recent: list[dict[str, Any]]) -> str:
         recent_titles = [r.get("title", "Untitled") for r in recent[:7]]
-        system = (
-            "You are a world-class lucid dreaming protocol designer. "
-            "Make a 7-day progressive protocol for a Telegram user. "
-            "Blend consistency and variety to reduce dropout. "
-            "Use sections: Day Routine, Pre-Sleep, Night Interrupt, Morning Capture, Weekly Review. "
-            "Add a difficulty score 1-10 and one anti-burnout adaptation."
-        )
         user = (
             f"Stats: {stats}\n"
             f"Recent dream titles: {recent_titles}\n"
             "Goal: maximize lucid dreaming rate without harming sleep quality."
         )
-        return self._chat(system, user)
+        return await self._chat(_SYS_PROTOCOL, user)
 
-    def blockage_scan(self, stats: dict[str, Any], recent: list[dict[str, Any]]) -> str:
+    async def blockage_scan(self, stats: dict[str, Any], recent: list[dict[str, Any]]) -> str:
         filtered = []
         for row in recent:
             if row.get("no_dream_recall"):
                 continue
-            filtered.append(
-                {
-                    "entry_date": row.get("entry_date"),
-                    "title": row.get("title"),
-                    "narrative": str(row.get("narrative", ""))[:500],
-                    "mood": row.get("mood"),
-                    "symbols": row.get("symbols"),
-                    "characters": row.get("characters"),
-                    "lucidity_score": row.get("lucidity_score"),
-                    "wake_feeling": row.get("wake_feeling"),
-                }
-            )
+            item = {key: row.get(key) for key in _BLOCKAGE_SCAN_KEYS}
+            item["narrative"] = (row.get("narrative") or "")[:500]
+            filtered.append(item)
+            if len(filtered) == 8:
+                break
 
-        system = (
-            "You are a lucid dreaming coach focused on finding and fixing personal blockages. "
-            "Use three lenses and label each as a hypothesis, not certainty:\n"
-            "1) Psychoanalytic/depth (Freud/Jung-style conflict, shadow, compensatory themes).\n"
-            "2) Cognitive/neurocognitive (Domhoff-style continuity of waking concerns and emotion).\n"
-            "3) Threat simulation (Revonsuo-style fear/threat rehearsal patterns).\n"
-            "Never diagnose disorders or claim medical truth. Keep practical and safe.\n"
-            "Respond in plain text with sections:\n"
-            "Likely Blockages:\n"
-            "Evidence From Recent Dreams:\n"
-            "Framework Synthesis (Depth / Cognitive / Threat):\n"
-            "Lucid Repair Plan (Day / Pre-Sleep / In-Dream / Morning):\n"
-            "7-Day Exposure Ladder:\n"
-            "Tonight's One-Sentence Intention:\n"
-            "Use concise bullets."
-        )
+        dreams = json.dumps(filtered, default=str, ensure_ascii=False, separators=(",", ":"))
         user = (
             f"Stats: {stats}\n"
-            f"Recent recalled dreams (latest first): {filtered[:8]}\n"
+            f"Recent recalled dreams (latest first): {dreams}\n"
             "Goal: identify emotional blockages/fears and convert them into lucid dream practice steps."
         )
-        return self._chat(system, user)
+        return await self._chat(_SYS_BLOCKAGE, user)
 
-    def potential_blockages_paragraph(self, entry: dict[str, Any]) -> str:
+    async def potential_blockages_paragraph(self, entry: dict[str, Any]) -> str:
         if not self.enabled or self.client is None:
             return self._fallback_blockage_paragraph(entry)
 
-        system = (
-            "You are a lucid dream coach. "
-            "Write exactly one short paragraph (2-3 sentences, max 70 words). "
-            "Infer potential emotional/behavioral blockages as hypotheses only, not facts. "
-            "Blend depth (Freud/Jung), cognitive continuity (Domhoff), and threat simulation (Revonsuo) briefly. "
-            "End with one practical next step for tonight."
-        )
-        user = (
-            f"Title: {entry.get('title', '')}\n"
-            f"Narrative: {entry.get('narrative', '')}\n"
-            f"Mood: {entry.get('mood', '')}\n"
-            f"Symbols: {entry.get('symbols', '')}\n"
-            f"Self interpretation: {entry.get('self_interpretation', '')}"
-        )
-        text = self._chat(system, user).strip()
+        text = (await self._chat(_SYS_BLOCKAGE_PARA, _render_fields(entry, _BLOCKAGE_PARA_FIELDS))).strip()
         if not text or "AI analysis unavailable right now" in text:
             return self._fallback_blockage_paragraph(entry)
         return text